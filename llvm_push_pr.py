@@ -2,17 +2,21 @@
 """A script to automate the creation and landing of a stack of Pull Requests."""
 
 import argparse
+import http.client
+import io
 import json
 import os
 import re
+import shlex
 import subprocess
 import sys
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
 
 # TODO: Remove typing workarounds when we use a newer python.
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 from http.client import HTTPResponse
 from dataclasses import dataclass
 
@@ -26,9 +30,27 @@ LLVM_REPO = "ilovepi/llvm-push-pr"
 GITHUB_API = "https://api.github.com"
 
 MERGE_MAX_RETRIES = 10
-MERGE_RETRY_DELAY = 5  # seconds
+MERGE_RETRY_INITIAL_DELAY = 1  # seconds, doubled after every attempt
+MERGE_RETRY_MAX_DELAY = 16  # seconds
+MERGE_COMMIT_POLL_INTERVAL = 0.2  # seconds
+MERGE_COMMIT_TIMEOUT = 2  # seconds
 REQUEST_TIMEOUT = 30  # seconds
 
+# Auto-merge can only be enabled through the GraphQL API.
+ENABLE_AUTO_MERGE_MUTATION = """
+mutation($pullRequestId: ID!) {
+  enablePullRequestAutoMerge(
+    input: {pullRequestId: $pullRequestId, mergeMethod: SQUASH}
+  ) {
+    clientMutationId
+  }
+}
+"""
+
+_PR_NUMBER_RE = re.compile(r"/pull/(\d+)")
+_BRANCH_NAME_STRIP_RE = re.compile(r"[^\w\s-]")
+_BRANCH_NAME_COLLAPSE_RE = re.compile(r"[-\s]+")
+
 
 class LlvmPrError(Exception):
     """Custom exception for errors in the PR automator script."""
@@ -66,7 +88,7 @@ class CommandRunner:
 
     def verbose_print(self, message: str, file=sys.stdout) -> None:
         if self.verbose:
-            print(message, file)
+            print(message, file=file)
 
     def run_command(
         self,
@@ -79,10 +101,12 @@ class CommandRunner:
         env: Optional[dict] = None,
     ) -> subprocess.CompletedProcess:
         if self.dry_run and not read_only:
-            self.print(f"[Dry Run] Would run: {' '.join(command)}")
+            self.print(f"[Dry Run] Would run: {shlex.join(command)}")
             return subprocess.CompletedProcess(command, 0, "", "")
 
-        self.verbose_print(f"Running: {' '.join(command)}")
+        # Only build the command string when it will actually be printed.
+        if self.verbose:
+            self.verbose_print(f"Running: {shlex.join(command)}")
 
         try:
             return subprocess.run(
@@ -98,7 +122,7 @@ class CommandRunner:
                 f"Command '{command[0]}' not found. Is it installed and in your PATH?"
             ) from e
         except subprocess.CalledProcessError as e:
-            self.print(f"Error running command: {' '.join(command)}", file=sys.stderr)
+            self.print(f"Error running command: {shlex.join(command)}", file=sys.stderr)
             if e.stdout:
                 self.print(f"--- stdout ---\n{e.stdout}", file=sys.stderr)
             if e.stderr:
@@ -106,6 +130,72 @@ class CommandRunner:
             raise e
 
 
+class BufferedHTTPResponse(io.BytesIO):
+    """A fully read HTTP response that no longer holds on to its connection."""
+
+    def __init__(self, body: bytes, status: int, headers: http.client.HTTPMessage):
+        super().__init__(body)
+        self.status = status
+        self.headers = headers
+
+
+class PersistentHTTPSOpener:
+    """Sends requests over one kept-alive HTTPS connection per host.
+
+    urllib closes the connection after every request, so each API call would
+    otherwise pay for a new TCP connection and TLS handshake. Responses are read
+    eagerly so the connection can be reused. Every non-2xx status raises
+    urllib.error.HTTPError, including redirects, which urllib would follow.
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, http.client.HTTPSConnection] = {}
+
+    def open(
+        self, req: urllib.request.Request, timeout: float = REQUEST_TIMEOUT
+    ) -> BufferedHTTPResponse:
+        url = urllib.parse.urlsplit(req.full_url)
+        path = f"{url.path}?{url.query}" if url.query else url.path
+        response, body = self._send(req, url.netloc, path, timeout)
+
+        if not 200 <= response.status < 300:
+            raise urllib.error.HTTPError(
+                req.full_url,
+                response.status,
+                response.reason,
+                response.headers,
+                io.BytesIO(body),
+            )
+        return BufferedHTTPResponse(body, response.status, response.headers)
+
+    def _send(
+        self, req: urllib.request.Request, host: str, path: str, timeout: float
+    ) -> Tuple[http.client.HTTPResponse, bytes]:
+        if host not in self.connections:
+            self.connections[host] = http.client.HTTPSConnection(host, timeout=timeout)
+        connection = self.connections[host]
+        headers = dict(req.header_items())
+        try:
+            try:
+                connection.request(req.get_method(), path, req.data, headers)
+                response = connection.getresponse()
+            except (
+                http.client.RemoteDisconnected,
+                ConnectionResetError,
+                BrokenPipeError,
+            ):
+                # The server closed the idle connection; reconnect and retry once.
+                connection.close()
+                connection.request(req.get_method(), path, req.data, headers)
+                response = connection.getresponse()
+            return response, response.read()
+        except BaseException:
+            # A request that failed part way, e.g. on a timeout, leaves the
+            # connection unusable for the next one, so start over next time.
+            connection.close()
+            raise
+
+
 class GitHubAPI:
     """A wrapper for the GitHub API."""
 
@@ -116,13 +206,35 @@ class GitHubAPI:
             "Accept": "application/vnd.github.v3+json",
             "User-Agent": "llvm-push-pr",
         }
-        self.opener = urllib.request.build_opener(
-            urllib.request.HTTPHandler(), urllib.request.HTTPSHandler()
-        )
+        # Numbers and GraphQL node IDs of the PRs created by this run, keyed by
+        # PR URL.
+        self.pr_numbers: Dict[str, str] = {}
+        self.pr_node_ids: Dict[str, str] = {}
+        # ETag and parsed body of GET responses, keyed by endpoint. Conditional
+        # requests answered with 304 Not Modified don't count against the rate
+        # limit.
+        self.etag_cache: Dict[str, Tuple[str, dict]] = {}
+        # How long GitHub asked us to wait before the next request, if at all.
+        self.retry_after: Optional[float] = None
+        # When the exhausted rate limit resets, if the last response said so.
+        self.rate_limit_reset: Optional[int] = None
+        self.opener: Union[PersistentHTTPSOpener, urllib.request.OpenerDirector]
+        if urllib.request.getproxies().get("https"):
+            # Only urllib knows how to go through a proxy.
+            self.opener = urllib.request.build_opener(
+                urllib.request.HTTPHandler(), urllib.request.HTTPSHandler()
+            )
+        else:
+            self.opener = PersistentHTTPSOpener()
 
     def _request(
-        self, method: str, endpoint: str, json_payload: Optional[dict] = None
-    ) -> HTTPResponse:
+        self,
+        method: str,
+        endpoint: str,
+        json_payload: Optional[dict] = None,
+        extra_headers: Optional[Dict[str, str]] = None,
+    ) -> Union[HTTPResponse, BufferedHTTPResponse]:
+        self._wait_for_rate_limit_reset()
         url = f"{GITHUB_API}{endpoint}"
         self.runner.verbose_print(f"API Request: {method.upper()} {url}")
         if json_payload:
@@ -133,14 +245,20 @@ class GitHubAPI:
         if json_payload:
             data = json.dumps(json_payload).encode("utf-8")
             headers["Content-Type"] = "application/json"
+        if extra_headers:
+            headers.update(extra_headers)
 
         req = urllib.request.Request(
             url, data=data, headers=headers, method=method.upper()
         )
 
         try:
-            return self.opener.open(req, timeout=REQUEST_TIMEOUT)
+            response = self.opener.open(req, timeout=REQUEST_TIMEOUT)
         except urllib.error.HTTPError as e:
+            self._record_wait_headers(e.headers)
+            if e.code == 304:
+                # Not an error: the answer to a conditional request.
+                raise e
             self.runner.print(
                 f"Error making API request to {url}: {e}", file=sys.stderr
             )
@@ -149,17 +267,77 @@ class GitHubAPI:
             )
             raise e
 
+        self._record_wait_headers(response.headers)
+        return response
+
+    def _record_wait_headers(self, headers) -> None:
+        """Remembers how long GitHub asked us to wait before the next request."""
+        self.retry_after = None
+        self.rate_limit_reset = None
+        if not headers:
+            return
+        try:
+            retry_after = headers.get("Retry-After") or headers.get("X-Poll-Interval")
+            self.retry_after = float(retry_after) if retry_after else None
+            if headers.get("X-RateLimit-Remaining") == "0":
+                self.rate_limit_reset = int(headers.get("X-RateLimit-Reset"))
+        except (TypeError, ValueError):
+            pass
+
+    def _wait_for_rate_limit_reset(self) -> None:
+        """Sleeps until the rate limit resets if the last request exhausted it.
+
+        This avoids issuing requests that GitHub would reject with a 403. The
+        wait happens before the next request, so a run whose last request used
+        up the limit still exits right away.
+        """
+        if self.rate_limit_reset is None:
+            return
+        delay = self.rate_limit_reset - time.time()
+        self.rate_limit_reset = None
+        if delay <= 0:
+            return
+        self.runner.print(
+            f"GitHub API rate limit exhausted. Waiting {int(delay) + 1} seconds for it to reset...",
+            file=sys.stderr,
+        )
+        time.sleep(delay + 1)
+
     def _request_and_parse_json(
         self, method: str, endpoint: str, json_payload: Optional[dict] = None
     ) -> dict:
+        if method.upper() == "GET":
+            return self._conditional_get(endpoint)
         with self._request(method, endpoint, json_payload) as response:
-            # Expect a 200 'OK' or 201 'Created' status on success and JSON body.
-            self._log_unexpected_status([200, 201], response.status)
+            return self._parse_json_response(response)
+
+    def _conditional_get(self, endpoint: str) -> dict:
+        """Sends a GET, reusing the cached body if GitHub reports no change."""
+        cached = self.etag_cache.get(endpoint)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        try:
+            with self._request("GET", endpoint, extra_headers=headers) as response:
+                response_data = self._parse_json_response(response)
+                etag = response.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached:
+                self.runner.verbose_print(f"Not modified: {endpoint}")
+                return cached[1]
+            raise e
+        if etag:
+            self.etag_cache[endpoint] = (etag, response_data)
+        return response_data
+
+    def _parse_json_response(
+        self, response: Union[HTTPResponse, BufferedHTTPResponse]
+    ) -> dict:
+        # Expect a 200 'OK' or 201 'Created' status on success and JSON body.
+        self._log_unexpected_status([200, 201], response.status)
 
-            response_text = response.read().decode("utf-8")
-            if response_text:
-                return json.loads(response_text)
-            return {}
+        response_text = response.read().decode("utf-8")
+        if response_text:
+            return json.loads(response_text)
+        return {}
 
     def _request_no_content(
         self, method: str, endpoint: str, json_payload: Optional[dict] = None
@@ -178,6 +356,16 @@ class GitHubAPI:
                 file=sys.stderr,
             )
 
+    def _graphql(self, query: str, variables: dict) -> dict:
+        response_data = self._request_and_parse_json(
+            "POST", "/graphql", {"query": query, "variables": variables}
+        )
+        # GraphQL reports failures in the body of a 200 response.
+        if response_data.get("errors"):
+            messages = "; ".join(e.get("message", "") for e in response_data["errors"])
+            raise LlvmPrError(f"GitHub GraphQL request failed: {messages}")
+        return response_data.get("data", {})
+
     def get_user_login(self) -> str:
         return self._request_and_parse_json("GET", "/user")["login"]
 
@@ -201,10 +389,24 @@ class GitHubAPI:
             "POST", f"/repos/{LLVM_REPO}/pulls", json_payload=data
         )
         pr_url = response_data.get("html_url")
+        if pr_url and response_data.get("number"):
+            self.pr_numbers[pr_url] = str(response_data["number"])
+        if pr_url and response_data.get("node_id"):
+            self.pr_node_ids[pr_url] = response_data["node_id"]
         if not self.runner.dry_run:
             self.runner.print(f"Pull request created: {pr_url}")
         return pr_url
 
+    def _get_pr_number(self, pr_url: str) -> str:
+        # Known for every PR created by this run, so parsing the URL is only
+        # a fallback.
+        if pr_url in self.pr_numbers:
+            return self.pr_numbers[pr_url]
+        pr_number_match = _PR_NUMBER_RE.search(pr_url)
+        if not pr_number_match:
+            raise LlvmPrError(f"Could not extract PR number from URL: {pr_url}")
+        return pr_number_match.group(1)
+
     def get_repo_settings(self) -> dict:
         return self._request_and_parse_json("GET", f"/repos/{LLVM_REPO}")
 
@@ -214,22 +416,57 @@ class GitHubAPI:
             "GET", f"/repos/{LLVM_REPO}/pulls/{pr_number}"
         )
 
-    def _attempt_squash_merge(self, pr_number: str) -> bool:
-        """Attempts to squash merge a PR, returning True on success."""
+    def _attempt_squash_merge(self, pr_number: str) -> Optional[dict]:
+        """Attempts to squash merge a PR.
+
+        Returns GitHub's merge result, which holds the squashed commit's SHA, or
+        None if the PR could not be merged yet.
+        """
         try:
-            self._request_and_parse_json(
+            return self._request_and_parse_json(
                 "PUT",
                 f"/repos/{LLVM_REPO}/pulls/{pr_number}/merge",
                 json_payload={"merge_method": "squash"},
             )
-            return True
         except urllib.error.HTTPError as e:
             # A 405 status code means the PR is not in a mergeable state.
             if e.code == 405:
-                return False
+                return None
+            # Secondary rate limits are reported as a 403 or 429 with a
+            # Retry-After header, which merge_pr waits for before retrying.
+            if e.code in (403, 429) and self.retry_after:
+                return None
             # Re-raise other HTTP errors.
             raise e
 
+    def _wait_for_merge_commit(
+        self, base_branch: Optional[str], merge_sha: Optional[str]
+    ) -> None:
+        """Gives GitHub a moment to move the base branch to the merge commit.
+
+        The next step fetches the base branch, which must contain the squashed
+        commit. The PR has already merged by now, so failed lookups are not
+        fatal; they only end the wait once MERGE_COMMIT_TIMEOUT has passed.
+        """
+        if not base_branch or not merge_sha:
+            return
+        deadline = time.monotonic() + MERGE_COMMIT_TIMEOUT
+        while True:
+            try:
+                ref = self._request_and_parse_json(
+                    "GET", f"/repos/{LLVM_REPO}/git/ref/heads/{base_branch}"
+                )
+                if ref.get("object", {}).get("sha") == merge_sha:
+                    return
+            except (urllib.error.URLError, OSError) as e:
+                self.runner.verbose_print(
+                    f"Could not check '{base_branch}' for the merge commit: {e}",
+                    file=sys.stderr,
+                )
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(MERGE_COMMIT_POLL_INTERVAL)
+
     def merge_pr(self, pr_url: str) -> Optional[str]:
         if not pr_url:
             return None
@@ -238,11 +475,9 @@ class GitHubAPI:
             self.runner.print(f"[Dry Run] Would merge {pr_url}")
             return None
 
-        pr_number_match = re.search(r"/pull/(\d+)", pr_url)
-        if not pr_number_match:
-            raise LlvmPrError(f"Could not extract PR number from URL: {pr_url}")
-        pr_number = pr_number_match.group(1)
+        pr_number = self._get_pr_number(pr_url)
 
+        delay = MERGE_RETRY_INITIAL_DELAY
         for i in range(MERGE_MAX_RETRIES):
             self.runner.print(
                 f"Attempting to merge {pr_url} (attempt {i + 1}/{MERGE_MAX_RETRIES})..."
@@ -255,15 +490,26 @@ class GitHubAPI:
                 raise LlvmPrError("Merge conflict.")
 
             if pr_data.get("mergeable"):
-                if self._attempt_squash_merge(pr_number):
+                merge_result = self._attempt_squash_merge(pr_number)
+                if merge_result is not None:
                     self.runner.print("Successfully merged.")
-                    time.sleep(2)  # Allow GitHub's API to update.
+                    self._wait_for_merge_commit(
+                        pr_data.get("base", {}).get("ref"), merge_result.get("sha")
+                    )
                     return head_branch
 
+            if i == MERGE_MAX_RETRIES - 1:
+                # Out of attempts; waiting again would only delay the error.
+                break
+
+            # Mergeability is usually computed within a second or two, so start
+            # polling quickly and back off, unless GitHub asks for longer.
+            wait = max(delay, self.retry_after or 0)
             self.runner.print(
-                f"PR not mergeable yet (state: {pr_data.get('mergeable_state', 'unknown')}). Retrying in {MERGE_RETRY_DELAY} seconds..."
+                f"PR not mergeable yet (state: {pr_data.get('mergeable_state', 'unknown')}). Retrying in {wait:g} seconds..."
             )
-            time.sleep(MERGE_RETRY_DELAY)
+            time.sleep(wait)
+            delay = min(delay * 2, MERGE_RETRY_MAX_DELAY)
 
         raise LlvmPrError(f"PR was not mergeable after {MERGE_MAX_RETRIES} attempts.")
 
@@ -275,21 +521,14 @@ class GitHubAPI:
             self.runner.print(f"[Dry Run] Would enable auto-merge for {pr_url}")
             return
 
-        pr_number_match = re.search(r"/pull/(\d+)", pr_url)
-        if not pr_number_match:
-            raise LlvmPrError(f"Could not extract PR number from URL: {pr_url}")
-        pr_number = pr_number_match.group(1)
+        pr_number = self._get_pr_number(pr_url)
 
         self.runner.print(f"Enabling auto-merge for {pr_url}...")
-        data = {
-            "enabled": True,
-            "merge_method": "squash",
-        }
-        self._request_no_content(
-            "PUT",
-            f"/repos/{LLVM_REPO}/pulls/{pr_number}/auto-merge",
-            json_payload=data,
-        )
+        # Reuse the node ID from create_pr when possible to avoid a lookup.
+        node_id = self.pr_node_ids.get(pr_url)
+        if not node_id:
+            node_id = self._get_pr_details(pr_number)["node_id"]
+        self._graphql(ENABLE_AUTO_MERGE_MUTATION, {"pullRequestId": node_id})
         self.runner.print("Auto-merge enabled.")
 
     def add_labels(self, pr_url: str, labels: List[str]) -> None:
@@ -300,10 +539,7 @@ class GitHubAPI:
             self.runner.print(f"[Dry Run] Would add labels {labels} to {pr_url}")
             return
 
-        pr_number_match = re.search(r"/pull/(\d+)", pr_url)
-        if not pr_number_match:
-            raise LlvmPrError(f"Could not extract PR number from URL: {pr_url}")
-        pr_number = pr_number_match.group(1)
+        pr_number = self._get_pr_number(pr_url)
 
         self.runner.print(f"Adding labels {labels} to {pr_url}...")
         self._request_and_parse_json(
@@ -352,6 +588,8 @@ class LLVMPRAutomator:
         self.original_branch: str = ""
         self.created_branches: List[str] = []
         self.repo_settings: dict = {}
+        self.commit_details: Dict[str, Tuple[str, str]] = {}
+        self.remote_urls: Dict[str, str] = {}
 
     def _get_git_env(self) -> dict:
         git_env = os.environ.copy()
@@ -397,8 +635,20 @@ class LLVMPRAutomator:
 
         https_upstream_url = self._get_https_url_for_remote(self.config.upstream_remote)
         refspec = f"refs/heads/{self.config.base_branch}:refs/remotes/{self.config.upstream_remote}/{self.config.base_branch}"
+        # Tags are not needed to rebase, and skipping them avoids transferring
+        # LLVM's release tags. This fetch runs once per landed commit, so also
+        # keep it from kicking off an automatic gc each time.
         self.runner.run_command(
-            ["git", "fetch", https_upstream_url, refspec], env=git_env
+            [
+                "git",
+                "-c",
+                "gc.auto=0",
+                "fetch",
+                "--no-tags",
+                https_upstream_url,
+                refspec,
+            ],
+            env=git_env,
         )
 
         try:
@@ -413,9 +663,17 @@ class LLVMPRAutomator:
             if e.stderr:
                 self.runner.print(f"--- stderr ---\n{e.stderr}", file=sys.stderr)
 
-            # Check if rebase is in progress before aborting
-            rebase_status_result = self.runner.run_command(
-                ["git", "status", "--verify-status=REBASE_HEAD"],
+            # Check if rebase is in progress before aborting. git keeps its
+            # state in one of these directories while a rebase is stopped.
+            rebase_dirs_result = self.runner.run_command(
+                [
+                    "git",
+                    "rev-parse",
+                    "--git-path",
+                    "rebase-merge",
+                    "--git-path",
+                    "rebase-apply",
+                ],
                 check=False,
                 capture_output=True,
                 text=True,
@@ -423,8 +681,9 @@ class LLVMPRAutomator:
                 env=git_env,
             )
 
-            # REBASE_HEAD exists, so rebase is in progress
-            if rebase_status_result.returncode == 0:
+            if any(
+                os.path.isdir(path) for path in rebase_dirs_result.stdout.splitlines()
+            ):
                 self.runner.print("Aborting rebase...", file=sys.stderr)
                 self.runner.run_command(
                     ["git", "rebase", "--abort"], check=False, env=git_env
@@ -432,7 +691,18 @@ class LLVMPRAutomator:
             raise LlvmPrError("rebase operation failed.") from e
 
     def _get_https_url_for_remote(self, remote_name: str) -> str:
-        """Gets the URL for a remote and converts it to HTTPS if necessary."""
+        """Gets the URL for a remote and converts it to HTTPS if necessary.
+
+        Remote URLs do not change during a run, so each one is only looked up
+        once.
+        """
+        if remote_name not in self.remote_urls:
+            self.remote_urls[remote_name] = self._lookup_https_url_for_remote(
+                remote_name
+            )
+        return self.remote_urls[remote_name]
+
+    def _lookup_https_url_for_remote(self, remote_name: str) -> str:
         remote_url_result = self.runner.run_command(
             ["git", "remote", "get-url", remote_name],
             capture_output=True,
@@ -450,31 +720,49 @@ class LLVMPRAutomator:
 
     def _get_commit_stack(self) -> List[str]:
         target = f"{self.config.upstream_remote}/{self.config.base_branch}"
+        # List the stack and read every commit message in one git call. Each
+        # record is "commit <hash>\n<message>\x1e", so it can be split
+        # unambiguously whatever the messages contain.
         result = self.runner.run_command(
-            ["git", "rev-list", "--reverse", f"{target}..HEAD"],
+            ["git", "rev-list", "--reverse", "--format=%B%x1e", f"{target}..HEAD"],
             capture_output=True,
             text=True,
             read_only=True,
         )
-        return result.stdout.strip().splitlines()
+        commits = []
+        for record in result.stdout.split("\x1e"):
+            header, _, message = record.lstrip("\n").partition("\n")
+            if header.startswith("commit "):
+                commit_hash = header[len("commit ") :]
+                commits.append(commit_hash)
+                self.commit_details[commit_hash] = self._split_commit_message(
+                    message
+                )
+        return commits
 
     def _get_commit_details(self, commit_hash: str) -> Tuple[str, str]:
-        # Get the subject and body from git show. Insert "\n\n" between to make
-        # parsing simple to do w/ split.
-        result = self.runner.run_command(
-            ["git", "show", "-s", "--format=%B", commit_hash],
-            capture_output=True,
-            text=True,
-            read_only=True,
-        )
-        parts = [item.strip() for item in result.stdout.split("\n", 1)]
+        if commit_hash not in self.commit_details:
+            result = self.runner.run_command(
+                ["git", "show", "-s", "--format=%B", commit_hash],
+                capture_output=True,
+                text=True,
+                read_only=True,
+            )
+            self.commit_details[commit_hash] = self._split_commit_message(
+                result.stdout
+            )
+        return self.commit_details[commit_hash]
+
+    @staticmethod
+    def _split_commit_message(message: str) -> Tuple[str, str]:
+        parts = [item.strip() for item in message.split("\n", 1)]
         title = parts[0]
         body = parts[1] if len(parts) > 1 else ""
         return title, body
 
     def _sanitize_branch_name(self, text: str) -> str:
-        sanitized = re.sub(r"[^\w\s-]", "", text).strip().lower()
-        sanitized = re.sub(r"[-\s]+", "-", sanitized)
+        sanitized = _BRANCH_NAME_STRIP_RE.sub("", text).strip().lower()
+        sanitized = _BRANCH_NAME_COLLAPSE_RE.sub("-", sanitized)
         # Use "auto-pr" as a fallback.
         return sanitized or "auto-pr"
 
@@ -492,12 +780,13 @@ class LLVMPRAutomator:
         self.runner.print(f"Found {num_commits} commit(s) to process.")
 
     def _create_and_push_branch_for_commit(
-        self, commit_hash: str, base_branch_name: str, index: int
+        self, commit_hash: str, commit_title: str, base_branch_name: str, index: int
     ) -> str:
         branch_name = f"{self.config.prefix}{base_branch_name}-{index + 1}"
-        commit_title, _ = self._get_commit_details(commit_hash)
-        self.runner.print(f"Processing commit {commit_hash[:7]}: {commit_title}")
-        self.runner.print(f"Pushing commit to temporary branch '{branch_name}'")
+        self.runner.print(
+            f"Processing commit {commit_hash[:7]}: {commit_title}\n"
+            f"Pushing commit to temporary branch '{branch_name}'"
+        )
 
         git_env = self._get_git_env()
 
@@ -519,7 +808,7 @@ class LLVMPRAutomator:
         commit_title, commit_body = self._get_commit_details(commit_hash)
 
         temp_branch = self._create_and_push_branch_for_commit(
-            commit_hash, base_branch_name, index
+            commit_hash, commit_title, base_branch_name, index
         )
         pr_url = self.github_api.create_pr(
             head_branch=f"{self.config.user_login}:{temp_branch}",
@@ -531,12 +820,9 @@ class LLVMPRAutomator:
 
         self.github_api.add_labels(pr_url, ["llvm-push"])
 
-        if self.config.no_merge:
-            return
-
         if self.config.auto_merge:
             self.github_api.enable_auto_merge(pr_url)
-        else:
+        elif not self.config.no_merge:
             merged_branch = self.github_api.merge_pr(pr_url)
             if merged_branch and not self.repo_settings.get("delete_branch_on_merge"):
                 # After a merge, the branch should be deleted.
@@ -544,7 +830,7 @@ class LLVMPRAutomator:
 
         if temp_branch in self.created_branches:
             # If the branch was successfully merged, it should not be deleted
-            # again during cleanup.
+            # again during cleanup. An open PR still needs its branch.
             self.created_branches.remove(temp_branch)
 
     def run(self) -> None:
@@ -569,6 +855,10 @@ class LLVMPRAutomator:
                     self.runner.print("Success! All commits have been landed.")
                     break
                 self._process_commit(commits[0], branch_base_name, i)
+                if self.config.no_merge or self.config.auto_merge:
+                    # Nothing has landed upstream yet, so there is nothing to
+                    # fetch or rebase onto.
+                    break
                 self._rebase_current_branch()
                 # After a rebase, the commit hashes can change, so we need to
                 # get the latest commit stack.
@@ -578,10 +868,8 @@ class LLVMPRAutomator:
             self._cleanup()
 
     def _cleanup(self) -> None:
-        self.runner.print(f"Returning to original branch: {self.original_branch}")
-        self.runner.run_command(
-            ["git", "checkout", self.original_branch], capture_output=True
-        )
+        # Commits are pushed by hash and rebases happen in place, so HEAD never
+        # leaves the original branch and there is nothing to check out here.
         if self.created_branches:
             self.runner.print("Cleaning up temporary remote branches...")
             for branch in self.created_branches:
@@ -590,7 +878,8 @@ class LLVMPRAutomator:
 
 def check_prerequisites(runner: CommandRunner) -> None:
     runner.print("Checking prerequisites...")
-    runner.run_command(["git", "--version"], capture_output=True, read_only=True)
+    # A missing git binary is reported by run_command, so this also checks
+    # that git is installed.
     result = runner.run_command(
         ["git", "rev-parse", "--is-inside-work-tree"],
         check=False,
@@ -2,6 +2,9 @@ import unittest
 from unittest.mock import MagicMock, patch, call, ANY
 import io
 import argparse
+import http.client
+import json
+import socket
 import subprocess
 import sys
 import os
@@ -11,6 +14,7 @@ import urllib.error
 from llvm_push_pr import (
     CommandRunner,
     GitHubAPI,
+    PersistentHTTPSOpener,
     LLVMPRAutomator,
     check_prerequisites,
     main,
@@ -99,10 +103,9 @@ class TestCheckPrerequisites(unittest.TestCase):
     def test_not_in_git_repo(self, mock_getenv):
         """Test that check_prerequisites exits if not in a git repo."""
         mock_command_runner = MagicMock(spec=CommandRunner)
-        mock_command_runner.run_command.side_effect = [
-            subprocess.CompletedProcess([], 0, ""),  # git --version
-            subprocess.CompletedProcess([], 1, "not a git repo"),  # git rev-parse
-        ]
+        mock_command_runner.run_command.return_value = subprocess.CompletedProcess(
+            [], 1, "not a git repo"
+        )
         with self.assertRaises(LlvmPrError):
             check_prerequisites(mock_command_runner)
 
@@ -132,6 +135,30 @@ class TestCommandRunner(unittest.TestCase):
             command_runner.print("test message")
             mock_print.assert_not_called()
 
+    def test_verbose_print_to_stderr(self):
+        """Test that verbose_print writes to the requested file."""
+        with patch("builtins.print") as mock_print:
+            command_runner = CommandRunner(verbose=True)
+            command_runner.verbose_print("test message", file=sys.stderr)
+            mock_print.assert_called_once_with("test message", file=sys.stderr)
+
+    def test_run_command_not_verbose_skips_formatting(self):
+        """Test that run_command does not format the command when not verbose."""
+        command_runner = CommandRunner()
+        with patch("shlex.join") as mock_join, patch("subprocess.run"):
+            command_runner.run_command(["git", "status"])
+        mock_join.assert_not_called()
+
+    def test_run_command_dry_run_quotes_command(self):
+        """Test that dry runs print a command that can be pasted into a shell."""
+        command_runner = CommandRunner(dry_run=True)
+        with patch("builtins.print") as mock_print, patch("subprocess.run") as mock_run:
+            command_runner.run_command(["git", "commit", "-m", "A title"])
+        mock_run.assert_not_called()
+        mock_print.assert_called_once_with(
+            "[Dry Run] Would run: git commit -m 'A title'", file=sys.stdout
+        )
+
     def test_run_command_file_not_found(self):
         """Test that run_command exits if the command is not found."""
         with patch("subprocess.run", side_effect=FileNotFoundError):
@@ -156,6 +183,94 @@ class TestCommandRunner(unittest.TestCase):
             command_runner.run_command(["false"])
 
 
+class TestPersistentHTTPSOpener(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("http.client.HTTPSConnection")
+        self.mock_connection_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_connection = self.mock_connection_class.return_value
+        self.opener = PersistentHTTPSOpener()
+
+    def _mock_response(self, status, body):
+        response = MagicMock(status=status, reason="Reason")
+        response.read.return_value = body
+        return response
+
+    def test_reuses_connection(self):
+        """Test that consecutive requests share one HTTPS connection."""
+        self.mock_connection.getresponse.side_effect = [
+            self._mock_response(200, b'{"login": "a"}'),
+            self._mock_response(201, b"{}"),
+        ]
+
+        with self.opener.open(
+            urllib.request.Request("https://api.github.com/user")
+        ) as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.read(), b'{"login": "a"}')
+        self.opener.open(
+            urllib.request.Request(
+                "https://api.github.com/repos/a/b/pulls?state=open",
+                data=b"{}",
+                method="POST",
+            )
+        )
+
+        self.mock_connection_class.assert_called_once_with(
+            "api.github.com", timeout=ANY
+        )
+        self.mock_connection.request.assert_has_calls(
+            [
+                call("GET", "/user", None, ANY),
+                call("POST", "/repos/a/b/pulls?state=open", b"{}", ANY),
+            ]
+        )
+
+    def test_error_status_raises_http_error(self):
+        """Test that non-2xx responses raise HTTPError with the body attached."""
+        self.mock_connection.getresponse.return_value = self._mock_response(
+            405, b"Method Not Allowed"
+        )
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.opener.open(urllib.request.Request("https://api.github.com/user"))
+        self.assertEqual(cm.exception.code, 405)
+        self.assertEqual(cm.exception.read(), b"Method Not Allowed")
+
+    def test_retries_once_on_stale_connection(self):
+        """Test that a connection closed by the server is reopened once."""
+        self.mock_connection.getresponse.side_effect = [
+            http.client.RemoteDisconnected("closed"),
+            self._mock_response(200, b"{}"),
+        ]
+        self.opener.open(urllib.request.Request("https://api.github.com/user"))
+        self.mock_connection.close.assert_called_once()
+        self.assertEqual(self.mock_connection.request.call_count, 2)
+
+    def test_request_after_timeout(self):
+        """Test that a timed out request does not break the next one."""
+        # Like http.client, refuse a new request while one is still pending.
+        pending = []
+
+        def request(*args):
+            if pending:
+                raise http.client.CannotSendRequest("Request-sent")
+            pending.append(args)
+
+        self.mock_connection.request.side_effect = request
+        self.mock_connection.close.side_effect = pending.clear
+        self.mock_connection.getresponse.side_effect = [
+            socket.timeout("timed out"),
+            self._mock_response(200, b"{}"),
+        ]
+
+        with self.assertRaises(socket.timeout):
+            self.opener.open(urllib.request.Request("https://api.github.com/user"))
+        response = self.opener.open(
+            urllib.request.Request("https://api.github.com/user")
+        )
+        self.assertEqual(response.status, 200)
+
+
 class TestGitHubAPI(unittest.TestCase):
     def setUp(self):
         self.mock_command_runner = MagicMock(spec=CommandRunner)
@@ -164,6 +279,10 @@ class TestGitHubAPI(unittest.TestCase):
         self.github_api = GitHubAPI(self.mock_command_runner, "test_token")
         # Mock the opener to prevent real network calls.
         self.github_api.opener = MagicMock()
+        # Retry and rate-limit tests must never wait on the real clock.
+        patcher = patch("time.sleep")
+        self.mock_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_delete_branch_already_deleted(self):
         """Test that delete_branch handles a 422 error."""
@@ -223,6 +342,36 @@ class TestGitHubAPI(unittest.TestCase):
         with self.assertRaises(urllib.error.HTTPError):
             self.github_api._request("get", "/user")
 
+    def test_request_waits_for_rate_limit_reset(self):
+        """Test that the request after an exhausted rate limit waits for reset."""
+        mock_response = MagicMock()
+        mock_response.headers = {
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": "1010",
+        }
+        self.github_api.opener.open.return_value = mock_response
+        with patch("time.time", return_value=1000):
+            response = self.github_api._request("get", "/user")
+            self.assertIs(response, mock_response)
+            # Nothing may follow the last request, so it must not wait itself.
+            self.mock_sleep.assert_not_called()
+
+            mock_response.headers = {"X-RateLimit-Remaining": "5000"}
+            self.github_api._request("get", "/user")
+            self.github_api._request("get", "/user")
+        self.mock_sleep.assert_called_once_with(11)
+
+    def test_request_no_wait_with_remaining_rate_limit(self):
+        """Test that _request does not sleep while requests remain."""
+        mock_response = MagicMock()
+        mock_response.headers = {
+            "X-RateLimit-Remaining": "42",
+            "X-RateLimit-Reset": "1010",
+        }
+        self.github_api.opener.open.return_value = mock_response
+        self.github_api._request("get", "/user")
+        self.mock_sleep.assert_not_called()
+
     def test_get_user_login(self):
         """Test that get_user_login returns the correct login."""
         mock_response = MagicMock()
@@ -232,6 +381,23 @@ class TestGitHubAPI(unittest.TestCase):
         self.assertEqual(login, "test_user")
         self.github_api.opener.open.assert_called_once()
 
+    def test_get_not_modified_uses_cached_body(self):
+        """Test that a repeated GET sends the ETag and reuses the body on 304."""
+        mock_response = MagicMock(status=200, headers={"ETag": '"abc"'})
+        mock_response.read.return_value = b'{"mergeable": null}'
+        first = MagicMock()
+        first.__enter__.return_value = mock_response
+        self.github_api.opener.open.side_effect = [
+            first,
+            urllib.error.HTTPError("url", 304, "Not Modified", {}, None),
+        ]
+
+        self.assertEqual(self.github_api._get_pr_details("1"), {"mergeable": None})
+        self.assertEqual(self.github_api._get_pr_details("1"), {"mergeable": None})
+
+        request = self.github_api.opener.open.call_args[0][0]
+        self.assertEqual(request.get_header("If-none-match"), '"abc"')
+
     def test_create_pr(self):
         """Test that create_pr returns the correct PR URL."""
         mock_response = MagicMock()
@@ -244,6 +410,27 @@ class TestGitHubAPI(unittest.TestCase):
         )
         self.assertEqual(pr_url, "https://github.com/test/repo/pull/1")
 
+    def test_create_pr_records_number_and_node_id(self):
+        """Test that create_pr remembers the number and node ID of the new PR."""
+        mock_response = MagicMock()
+        mock_response.read.return_value = (
+            b'{"html_url": "https://github.com/test/repo/pull/1", "number": 1,'
+            b' "node_id": "PR_1"}'
+        )
+        self.github_api.opener.open.return_value.__enter__.return_value = mock_response
+        pr_url = self.github_api.create_pr(
+            "feature-branch", "main", "Test PR", "Test Body", False
+        )
+        self.assertEqual(self.github_api.pr_numbers, {pr_url: "1"})
+        self.assertEqual(self.github_api.pr_node_ids, {pr_url: "PR_1"})
+
+    def test_get_pr_number_prefers_created_pr(self):
+        """Test that the number of a PR created by this run is not parsed."""
+        self.github_api.pr_numbers["https://example.com/some-pr"] = "42"
+        self.assertEqual(
+            self.github_api._get_pr_number("https://example.com/some-pr"), "42"
+        )
+
     def test_merge_pr_not_mergeable_after_retries(self):
         """Test that merge_pr raises an exception if the PR is not mergeable after retries."""
         mock_not_mergeable_response = MagicMock()
@@ -251,11 +438,35 @@ class TestGitHubAPI(unittest.TestCase):
         self.github_api.opener.open.return_value.__enter__.return_value = (
             mock_not_mergeable_response
         )
-        with patch("time.sleep"):  # Don't actually sleep
-            with self.assertRaisesRegex(
-                LlvmPrError, "PR was not mergeable after 10 attempts."
-            ):
-                self.github_api.merge_pr("https://github.com/test/repo/pull/1")
+        with self.assertRaisesRegex(
+            LlvmPrError, "PR was not mergeable after 10 attempts."
+        ):
+            self.github_api.merge_pr("https://github.com/test/repo/pull/1")
+
+    def test_merge_pr_backs_off_exponentially(self):
+        """Test that merge_pr doubles its retry delay up to the maximum."""
+        self.github_api._get_pr_details = MagicMock(
+            return_value={"mergeable": False, "head": {"ref": "feature-branch"}}
+        )
+        with self.assertRaises(LlvmPrError):
+            self.github_api.merge_pr("https://github.com/test/repo/pull/1")
+        self.assertEqual(
+            [c.args[0] for c in self.mock_sleep.call_args_list],
+            [1, 2, 4, 8, 16, 16, 16, 16, 16],
+        )
+
+    def test_merge_pr_honors_retry_after(self):
+        """Test that merge_pr waits at least as long as GitHub asks it to."""
+        mock_response = MagicMock(status=200, headers={"Retry-After": "7"})
+        mock_response.read.return_value = (
+            b'{"mergeable": false, "head": {"ref": "feature-branch"}}'
+        )
+        mock_response.__enter__.return_value = mock_response
+        self.github_api.opener.open.return_value = mock_response
+        with self.assertRaises(LlvmPrError):
+            self.github_api.merge_pr("https://github.com/test/repo/pull/1")
+        self.assertEqual(self.mock_sleep.call_args_list[0], call(7))
+        self.assertEqual(self.mock_sleep.call_args_list[4], call(16))
 
     def test_merge_pr_dirty(self):
         """Test that merge_pr exits if the mergeable state is 'dirty'."""
@@ -290,11 +501,31 @@ class TestGitHubAPI(unittest.TestCase):
             MagicMock(__enter__=MagicMock(return_value=mock_mergeable_response)),
             MagicMock(__enter__=MagicMock(return_value=mock_success_response)),
         ]
-        with patch("time.sleep"):  # Don't actually sleep
-            self.github_api.merge_pr("https://github.com/test/repo/pull/1")
+        self.github_api.merge_pr("https://github.com/test/repo/pull/1")
 
         self.assertEqual(self.github_api.opener.open.call_count, 4)
 
+    def test_merge_pr_secondary_rate_limit_retry(self):
+        """Test that merge_pr waits out a secondary rate limit and retries."""
+        self.github_api._get_pr_details = MagicMock(
+            side_effect=[
+                {"mergeable": True, "head": {"ref": "feature-branch"}},
+                {"mergeable": True, "head": {"ref": "feature-branch"}},
+            ]
+        )
+        mock_success_response = MagicMock(status=200, headers={})
+        mock_success_response.read.return_value = b"{}"
+        mock_success_response.__enter__.return_value = mock_success_response
+        self.github_api.opener.open.side_effect = [
+            urllib.error.HTTPError(
+                "url", 429, "Too Many Requests", {"Retry-After": "30"}, None
+            ),
+            mock_success_response,
+        ]
+        head_branch = self.github_api.merge_pr("https://github.com/test/repo/pull/1")
+        self.assertEqual(head_branch, "feature-branch")
+        self.mock_sleep.assert_called_once_with(30)
+
     def test_merge_pr_retry(self):
         """Test that merge_pr retries if the PR is not initially mergeable."""
         mock_not_mergeable_response = MagicMock()
@@ -311,11 +542,57 @@ class TestGitHubAPI(unittest.TestCase):
             MagicMock(__enter__=MagicMock(return_value=mock_mergeable_response)),
             MagicMock(__enter__=MagicMock(return_value=mock_merge_response)),
         ]
-        with patch("time.sleep"):  # Don't actually sleep
-            self.github_api.merge_pr("https://github.com/test/repo/pull/1")
+        self.github_api.merge_pr("https://github.com/test/repo/pull/1")
 
         self.assertEqual(self.github_api.opener.open.call_count, 3)
 
+    def test_merge_pr_survives_failed_merge_commit_check(self):
+        """Test that merge_pr still succeeds if checking the base branch fails."""
+        self.github_api._get_pr_details = MagicMock(
+            return_value={
+                "mergeable": True,
+                "head": {"ref": "feature-branch"},
+                "base": {"ref": "main"},
+            }
+        )
+        self.github_api._attempt_squash_merge = MagicMock(
+            return_value={"merged": True, "sha": "abc"}
+        )
+        self.github_api.opener.open.side_effect = socket.timeout("timed out")
+        with patch("time.monotonic", side_effect=[0, 1, 5]):
+            head_branch = self.github_api.merge_pr(
+                "https://github.com/test/repo/pull/1"
+            )
+        self.assertEqual(head_branch, "feature-branch")
+        self.assertEqual(self.github_api.opener.open.call_count, 2)
+
+    def test_wait_for_merge_commit_polls_until_base_moves(self):
+        """Test that _wait_for_merge_commit polls until the base has the merge."""
+        self.github_api._request_and_parse_json = MagicMock(
+            side_effect=[{"object": {"sha": "old"}}, {"object": {"sha": "abc"}}]
+        )
+        self.github_api._wait_for_merge_commit("main", "abc")
+        self.github_api._request_and_parse_json.assert_called_with(
+            "GET", "/repos/ilovepi/llvm-push-pr/git/ref/heads/main"
+        )
+        self.assertEqual(self.github_api._request_and_parse_json.call_count, 2)
+        self.mock_sleep.assert_called_once()
+
+    def test_wait_for_merge_commit_gives_up(self):
+        """Test that _wait_for_merge_commit stops polling after its timeout."""
+        self.github_api._request_and_parse_json = MagicMock(
+            return_value={"object": {"sha": "old"}}
+        )
+        with patch("time.monotonic", side_effect=[0, 1, 5]):
+            self.github_api._wait_for_merge_commit("main", "abc")
+        self.assertEqual(self.github_api._request_and_parse_json.call_count, 2)
+
+    def test_wait_for_merge_commit_without_sha(self):
+        """Test that _wait_for_merge_commit does nothing without a merge SHA."""
+        self.github_api._request_and_parse_json = MagicMock()
+        self.github_api._wait_for_merge_commit("main", None)
+        self.github_api._request_and_parse_json.assert_not_called()
+
 
 class TestLLVMPRAutomator(unittest.TestCase):
     def setUp(self):
@@ -376,6 +653,7 @@ class TestLLVMPRAutomator(unittest.TestCase):
                 "git",
                 "rev-list",
                 "--reverse",
+                "--format=%B%x1e",
                 f"{self.config.upstream_remote}/{self.config.base_branch}..HEAD",
             ],
             capture_output=True,
@@ -409,7 +687,9 @@ class TestLLVMPRAutomator(unittest.TestCase):
             "https://github.com/test/repo/pull/1"
         )
         self.automator.run()
-        mock_create_branch.assert_called_once_with("commit1", "feature-title", 0)
+        mock_create_branch.assert_called_once_with(
+            "commit1", "Feature Title", "feature-title", 0
+        )
 
     def test_get_commit_details_no_body(self):
         """Test that _get_commit_details handles commits with no body."""
@@ -422,10 +702,36 @@ class TestLLVMPRAutomator(unittest.TestCase):
         self.assertEqual(title, "Commit Title")
         self.assertEqual(body, "")
 
-    @patch.object(LLVMPRAutomator, "_get_commit_details", return_value=("", ""))
-    def test_create_and_push_branch_for_commit_empty_title(
-        self, mock_get_commit_details
-    ):
+    def test_get_commit_details_cached(self):
+        """Test that _get_commit_details only runs git once per commit."""
+        self.mock_command_runner.run_command.return_value = subprocess.CompletedProcess(
+            [], 0, stdout="Commit Title\n\nCommit Body\n"
+        )
+
+        self.automator._get_commit_details("commit1")
+        title, body = self.automator._get_commit_details("commit1")
+
+        self.assertEqual((title, body), ("Commit Title", "Commit Body"))
+        self.mock_command_runner.run_command.assert_called_once()
+
+    def test_get_commit_stack_reads_commit_details(self):
+        """Test that _get_commit_stack caches every commit message it lists."""
+        self.mock_command_runner.run_command.return_value = subprocess.CompletedProcess(
+            [],
+            0,
+            stdout="commit commit1\nTitle 1\n\nBody 1\n\x1e\ncommit commit2\nTitle 2\n\x1e\n",
+        )
+
+        commits = self.automator._get_commit_stack()
+
+        self.assertEqual(commits, ["commit1", "commit2"])
+        self.assertEqual(
+            self.automator._get_commit_details("commit1"), ("Title 1", "Body 1")
+        )
+        self.assertEqual(self.automator._get_commit_details("commit2"), ("Title 2", ""))
+        self.mock_command_runner.run_command.assert_called_once()
+
+    def test_create_and_push_branch_for_commit_empty_title(self):
         """Test that _create_and_push_branch_for_commit handles empty commit title."""
         self.mock_command_runner.run_command.side_effect = [
             # Result for _get_https_url_for_remote
@@ -436,7 +742,7 @@ class TestLLVMPRAutomator(unittest.TestCase):
 
         # Call the real method
         branch_name = self.automator._create_and_push_branch_for_commit(
-            "commit1", "base-branch", 0
+            "commit1", "", "base-branch", 0
         )
 
         # Assert the behavior
@@ -467,6 +773,19 @@ class TestLLVMPRAutomator(unittest.TestCase):
             # the more comprehensive test_rebase_current_branch_conflict.
             pass
 
+    def test_get_https_url_for_remote_cached(self):
+        """Test that each remote URL is only looked up once per run."""
+        self.mock_command_runner.run_command.return_value = subprocess.CompletedProcess(
+            [], 0, stdout="git@github.com:test/repo.git\n"
+        )
+
+        first = self.automator._get_https_url_for_remote("test_remote")
+        second = self.automator._get_https_url_for_remote("test_remote")
+
+        self.assertEqual(first, "https://github.com/test/repo.git")
+        self.assertEqual(second, first)
+        self.mock_command_runner.run_command.assert_called_once()
+
     @patch.object(LLVMPRAutomator, "_check_work_tree", return_value=None)
     def test_rebase_current_branch_conflict(self, mock_check_work_tree):
         """Test that _rebase_current_branch exits on rebase conflict."""
@@ -479,13 +798,17 @@ class TestLLVMPRAutomator(unittest.TestCase):
             subprocess.CompletedProcess([], 0, stdout=b""),
             # 3. Result for git rebase (failure)
             subprocess.CalledProcessError(1, "cmd"),
-            # 4. Result for git status
-            subprocess.CompletedProcess([], 0, stdout=""),
+            # 4. Result for git rev-parse --git-path
+            subprocess.CompletedProcess(
+                [], 0, stdout=".git/rebase-merge\n.git/rebase-apply\n"
+            ),
             # 5. Result for git rebase --abort
             subprocess.CompletedProcess([], 0, stdout=b""),
         ]
 
-        with self.assertRaises(LlvmPrError):
+        with self.assertRaises(LlvmPrError), patch(
+            "os.path.isdir", side_effect=lambda path: path == ".git/rebase-merge"
+        ):
             self.automator._rebase_current_branch()
 
         # Assert the calls to mock_command_runner.run_command
@@ -500,7 +823,10 @@ class TestLLVMPRAutomator(unittest.TestCase):
                 call(
                     [
                         "git",
+                        "-c",
+                        "gc.auto=0",
                         "fetch",
+                        "--no-tags",
                         "https://github.com/llvm/llvm-project.git",
                         "refs/heads/main:refs/remotes/upstream/main",
                     ],
@@ -511,7 +837,14 @@ class TestLLVMPRAutomator(unittest.TestCase):
                     env=ANY,
                 ),
                 call(
-                    ["git", "status", "--verify-status=REBASE_HEAD"],
+                    [
+                        "git",
+                        "rev-parse",
+                        "--git-path",
+                        "rebase-merge",
+                        "--git-path",
+                        "rebase-apply",
+                    ],
                     check=False,
                     capture_output=True,
                     text=True,
@@ -600,8 +933,26 @@ class TestLLVMPRAutomator(unittest.TestCase):
 
         self.mock_github_api.create_pr.assert_called_once()
         self.mock_github_api.merge_pr.assert_not_called()
+        self.automator._rebase_current_branch.assert_not_called()
         self.automator._cleanup.assert_called_once()
 
+    def test_process_commit_no_merge_keeps_branch(self):
+        """Test that --no-merge does not leave the PR's branch for cleanup."""
+        self.config.no_merge = True
+        self.automator.commit_details["commit1"] = ("Commit 1 Title", "Body")
+
+        def push_branch(*args):
+            self.automator.created_branches.append("test/feature-branch-1")
+            return "test/feature-branch-1"
+
+        self.automator._create_and_push_branch_for_commit = MagicMock(
+            side_effect=push_branch
+        )
+        self.automator._process_commit("commit1", "feature-branch", 0)
+
+        self.mock_github_api.merge_pr.assert_not_called()
+        self.assertEqual(self.automator.created_branches, [])
+
     @patch.object(LLVMPRAutomator, "_get_current_branch", return_value="feature-branch")
     @patch.object(
         LLVMPRAutomator,
@@ -658,8 +1009,8 @@ class TestLLVMPRAutomator(unittest.TestCase):
 
         mock_create_branch.assert_has_calls(
             [
-                call("commit1", "feature-branch", 0),
-                call("commit2", "feature-branch", 1),
+                call("commit1", "Commit 1 Title", "feature-branch", 0),
+                call("commit2", "Commit 2 Title", "feature-branch", 1),
             ]
         )
         self.mock_github_api.delete_branch.assert_has_calls(
@@ -705,7 +1056,9 @@ class TestLLVMPRAutomator(unittest.TestCase):
 
         self.automator.run()
 
-        mock_create_branch.assert_called_once_with("commit1", "feature-branch", 0)
+        mock_create_branch.assert_called_once_with(
+            "commit1", "Commit 1 Title", "feature-branch", 0
+        )
         self.mock_github_api.create_pr.assert_called_once_with(
             head_branch="test_user:test/feature-branch-1",
             base_branch="main",
@@ -740,9 +1093,7 @@ class TestLLVMPRAutomator(unittest.TestCase):
         # Call the real _cleanup method
         self.automator._cleanup()
 
-        self.mock_command_runner.run_command.assert_called_once_with(
-            ["git", "checkout", "feature-branch"], capture_output=True
-        )
+        self.mock_command_runner.run_command.assert_not_called()
         self.mock_github_api.delete_branch.assert_has_calls(
             [call("branch1"), call("branch2")]
         )
@@ -753,9 +1104,7 @@ class TestLLVMPRAutomator(unittest.TestCase):
 
         self.automator._cleanup()
 
-        self.mock_command_runner.run_command.assert_called_once_with(
-            ["git", "checkout", "feature-branch"], capture_output=True
-        )
+        self.mock_command_runner.run_command.assert_not_called()
         self.mock_github_api.delete_branch.assert_not_called()
 
     def test_run_auto_merge_multiple_commits(self):
@@ -846,8 +1195,42 @@ class TestNewFeatures(unittest.TestCase):
         mock_response = MagicMock()
         mock_response.read.return_value = b"{}"
         self.github_api.opener.open.return_value.__enter__.return_value = mock_response
+        self.github_api.pr_node_ids["https://github.com/test/repo/pull/1"] = "PR_1"
         self.github_api.enable_auto_merge("https://github.com/test/repo/pull/1")
         self.github_api.opener.open.assert_called_once()
+        request = self.github_api.opener.open.call_args[0][0]
+        self.assertEqual(request.full_url, "https://api.github.com/graphql")
+        payload = json.loads(request.data)
+        self.assertIn("enablePullRequestAutoMerge", payload["query"])
+        self.assertEqual(payload["variables"], {"pullRequestId": "PR_1"})
+
+    def test_enable_auto_merge_looks_up_node_id(self):
+        """Test that enable_auto_merge fetches the node ID of an unknown PR."""
+        mock_details_response = MagicMock()
+        mock_details_response.read.return_value = b'{"node_id": "PR_1"}'
+        mock_mutation_response = MagicMock()
+        mock_mutation_response.read.return_value = b'{"data": {}}'
+        self.github_api.opener.open.side_effect = [
+            MagicMock(__enter__=MagicMock(return_value=mock_details_response)),
+            MagicMock(__enter__=MagicMock(return_value=mock_mutation_response)),
+        ]
+        self.github_api.enable_auto_merge("https://github.com/test/repo/pull/1")
+        self.assertEqual(self.github_api.opener.open.call_count, 2)
+        request = self.github_api.opener.open.call_args[0][0]
+        self.assertEqual(
+            json.loads(request.data)["variables"], {"pullRequestId": "PR_1"}
+        )
+
+    def test_enable_auto_merge_graphql_error(self):
+        """Test that enable_auto_merge raises when GraphQL reports an error."""
+        mock_response = MagicMock()
+        mock_response.read.return_value = (
+            b'{"errors": [{"message": "Auto merge is not allowed"}]}'
+        )
+        self.github_api.opener.open.return_value.__enter__.return_value = mock_response
+        self.github_api.pr_node_ids["https://github.com/test/repo/pull/1"] = "PR_1"
+        with self.assertRaisesRegex(LlvmPrError, "Auto merge is not allowed"):
+            self.github_api.enable_auto_merge("https://github.com/test/repo/pull/1")
 
     def test_delete_branch_refuses_default(self):
         """Test that delete_branch refuses to delete the default branch."""
@@ -887,6 +1270,7 @@ class TestNewFeatures(unittest.TestCase):
         self.github_api.enable_auto_merge.assert_called_once_with(
             "https://github.com/test/repo/pull/1"
         )
+        self.automator._rebase_current_branch.assert_not_called()
 
     def test_run_avoids_deleting_branch_when_repo_auto_deletes(self):
         """Test that run does not delete branch if repo is set to auto-delete."""
@@ -907,6 +1291,7 @@ class TestNewFeatures(unittest.TestCase):
             return_value="https://github.com/test/repo/pull/1"
         )
         self.github_api.merge_pr = MagicMock(return_value="test/branch")
+        self.github_api.add_labels = MagicMock()
         self.github_api.delete_branch = MagicMock()
         self.github_api.get_repo_settings = MagicMock(
             return_value={"delete_branch_on_merge": True, "default_branch": "main"}
@@ -939,6 +1324,7 @@ class TestNewFeatures(unittest.TestCase):
             return_value="https://github.com/test/repo/pull/1"
         )
         self.github_api.merge_pr = MagicMock(return_value="test/branch")
+        self.github_api.add_labels = MagicMock()
         self.github_api.delete_branch = MagicMock()  # Mock delete_branch for this test
         self.automator.repo_settings = {"delete_branch_on_merge": False}
         self.github_api.get_repo_settings = MagicMock(